@@ -1,28 +1,241 @@
 import os
+import io
+import glob
 import json
-import gzip
+import time
+import random
+import asyncio
+import logging
 import boto3
+import numpy as np
+from botocore.config import Config
 from dotenv import load_dotenv
 from tqdm import tqdm
+from datetime import datetime, timezone
+from itertools import chain
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from langchain_aws import BedrockEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader
+
+# Faiss es opcional: solo se usa para índices grandes (búsqueda aproximada IVF-PQ)
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# aioboto3 es opcional: si está instalado, los embeddings se piden con asyncio
+try:
+    import aioboto3
+except ImportError:
+    aioboto3 = None
 
 # --- Configuración ---
 load_dotenv()
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
-bedrock_client = boto3.client(service_name='bedrock-runtime', region_name='eu-central-1')
 
-print("🚀 RAG Documentation Navigator - Optimized Index Builder")
-print(f"📍 Región: eu-central-1 | 🪣 Bucket: {S3_BUCKET_NAME}")
-print("="*60)
+# Peticiones de embeddings simultáneas contra Bedrock (limitadas por la cuota TPM)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 16))
+# Textos por llamada a embed_documents
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+EMBED_MAX_RETRIES = 5
+
+# A partir de este número de chunks se genera además un índice Faiss IVF-PQ
+FAISS_MIN_CHUNKS = int(os.getenv("FAISS_MIN_CHUNKS", 10000))
+# Cadena de index_factory; {nlist} se sustituye por el número de listas IVF.
+# Alternativa con cuantizador HNSW: "IVF{nlist}_HNSW32,PQ32"
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "IVF{nlist},PQ64")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16))
+
+# Reducción de dimensión con PCA (0 = desactivada). Titan v1 no es un modelo
+# Matryoshka, así que truncar dimensiones directamente degrada el recall.
+# Evaluar la calidad antes de activarla; con Faiss debe ser múltiplo de 64.
+PCA_DIMENSION = int(os.getenv("PCA_DIMENSION", 0))
+
+# Tipo de los embeddings en index.npz: "float16" (2 bytes/dim) o "int8"
+# (1 byte/dim más una escala por vector)
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float16")
+
+# El pool de conexiones debe admitir tantas peticiones como hilos en vuelo
+bedrock_client = boto3.client(
+    service_name='bedrock-runtime',
+    region_name='eu-central-1',
+    config=Config(max_pool_connections=EMBED_CONCURRENCY)
+)
+
+def embed_with_backoff(embeddings_model, text):
+    """
+    Genera el embedding de un texto, reintentando con backoff exponencial
+    cuando Bedrock responde con ThrottlingException.
+    Devuelve la excepción en lugar de lanzarla para no abortar el resto de chunks.
+    """
+    for attempt in range(EMBED_MAX_RETRIES):
+        try:
+            return embeddings_model.embed_documents([text])[0]
+        except Exception as e:
+            if "ThrottlingException" not in str(e) or attempt == EMBED_MAX_RETRIES - 1:
+                return e
+            time.sleep(2 ** attempt + random.random())
+
+def embed_batch(embeddings_model, texts):
+    """
+    Genera los embeddings de un lote con una sola llamada a embed_documents.
+    Si el lote falla (throttling o un texto problemático), sus textos se
+    reintentan uno a uno con backoff: así solo se pierde el chunk que falla
+    y el lote completo no se repite en cada reintento.
+    Devuelve un resultado por texto: el embedding o la excepción.
+    """
+    try:
+        return embeddings_model.embed_documents(texts)
+    except Exception:
+        return [embed_with_backoff(embeddings_model, text) for text in texts]
+
+class CachedLengthTextSplitter(RecursiveCharacterTextSplitter):
+    """
+    RecursiveCharacterTextSplitter que mide cada fragmento una sola vez.
+    El _merge_splits original vuelve a medir el primer fragmento cada vez que
+    desliza la ventana y la recorta con current_doc[1:] (una copia por pop);
+    aquí la ventana es un deque de pares (texto, longitud). El resultado es
+    idéntico al de la clase base.
+    """
+
+    def _merge_splits(self, splits, separator):
+        separator_len = self._length_function(separator)
+        
+        docs = []
+        window = deque()  # pares (texto, longitud) del chunk en construcción
+        total = 0
+        for split in splits:
+            split_len = self._length_function(split)
+            if total + split_len + (separator_len if window else 0) > self._chunk_size:
+                if total > self._chunk_size:
+                    logging.getLogger(__name__).warning(
+                        f"Created a chunk of size {total}, "
+                        f"which is longer than the specified {self._chunk_size}"
+                    )
+                if window:
+                    doc = self._join_docs([text for text, _ in window], separator)
+                    if doc is not None:
+                        docs.append(doc)
+                    # Deslizar la ventana hasta respetar el solapamiento y el tamaño
+                    while total > self._chunk_overlap or (
+                        total + split_len + (separator_len if window else 0) > self._chunk_size
+                        and total > 0
+                    ):
+                        _, first_len = window.popleft()
+                        total -= first_len + (separator_len if window else 0)
+            window.append((split, split_len))
+            total += split_len + (separator_len if len(window) > 1 else 0)
+        doc = self._join_docs([text for text, _ in window], separator)
+        if doc is not None:
+            docs.append(doc)
+        return docs
+
+def embed_texts_threaded(embeddings_model, texts):
+    """
+    Genera los embeddings en lotes de EMBED_BATCH_SIZE repartidos en un pool
+    de hilos. Devuelve un resultado por texto, en orden: el embedding o la
+    excepción que lo impidió (solo se marca el chunk que falló).
+    """
+    # Agrupar los textos en lotes y lanzarlos en paralelo; ex.map conserva el orden
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as executor:
+        batch_results = list(tqdm(
+            executor.map(lambda batch: embed_batch(embeddings_model, batch), batches),
+            total=len(batches),
+            desc="Procesando"
+        ))
+    
+    # Deshacer los lotes conservando el orden de los chunks
+    return list(chain.from_iterable(batch_results))
+
+async def embed_texts_async(texts):
+    """
+    Genera los embeddings con el cliente asíncrono de aioboto3: un único
+    event loop con como mucho EMBED_CONCURRENCY peticiones en vuelo.
+    Devuelve un resultado por texto, en orden: el embedding o la excepción.
+    """
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+    progress = tqdm(total=len(texts), desc="Procesando")
+    
+    async with aioboto3.Session().client(
+        service_name='bedrock-runtime',
+        region_name='eu-central-1',
+        config=Config(max_pool_connections=EMBED_CONCURRENCY)
+    ) as client:
+        async def embed_one(text):
+            async with semaphore:
+                for attempt in range(EMBED_MAX_RETRIES):
+                    try:
+                        # Mismo preprocesado que BedrockEmbeddings: sin saltos de línea
+                        response = await client.invoke_model(
+                            modelId="amazon.titan-embed-text-v1",
+                            contentType="application/json",
+                            accept="application/json",
+                            body=json.dumps({"inputText": text.replace(os.linesep, " ")})
+                        )
+                        response_body = json.loads(await response['body'].read())
+                        progress.update(1)
+                        return response_body['embedding']
+                    except Exception as e:
+                        if "ThrottlingException" not in str(e) or attempt == EMBED_MAX_RETRIES - 1:
+                            progress.update(1)
+                            return e
+                        await asyncio.sleep(2 ** attempt + random.random())
+        
+        # gather conserva el orden de los textos
+        results = await asyncio.gather(*(embed_one(text) for text in texts))
+    
+    progress.close()
+    return results
+
+def load_pdf(path):
+    """Extrae las páginas de un PDF. Se ejecuta en un proceso del pool."""
+    return PyPDFLoader(path).load()
 
 def create_optimized_index():
+    print("🚀 RAG Documentation Navigator - Optimized Index Builder")
+    print(f"📍 Región: eu-central-1 | 🪣 Bucket: {S3_BUCKET_NAME}")
+    print("="*60)
+    
+    # Validar la configuración antes de gastar llamadas a Bedrock
+    if EMBEDDING_DTYPE not in ("float16", "int8"):
+        print(f"❌ ERROR: EMBEDDING_DTYPE no soportado: '{EMBEDDING_DTYPE}' (usa 'float16' o 'int8')")
+        return
+    
+    # La factory de Faiss debe ser válida para la dimensión final (p. ej. PQ64
+    # exige un múltiplo de 64 con PCA_DIMENSION)
+    if faiss is not None:
+        dimension = PCA_DIMENSION if 0 < PCA_DIMENSION < 1536 else 1536
+        try:
+            probe_index = faiss.index_factory(
+                dimension, FAISS_INDEX_FACTORY.format(nlist=1), faiss.METRIC_INNER_PRODUCT
+            )
+        except Exception as e:
+            print(f"❌ ERROR: FAISS_INDEX_FACTORY '{FAISS_INDEX_FACTORY}' no es válida "
+                  f"para dimensión {dimension}: {e}")
+            return
+        try:
+            faiss.extract_index_ivf(probe_index)
+        except RuntimeError:
+            print(f"⚠️ FAISS_INDEX_FACTORY '{FAISS_INDEX_FACTORY}' no tiene capa IVF: "
+                  f"la Lambda no podrá ajustar nprobe (FAISS_NPROBE se ignora)")
+    
     # Paso 1: Cargar documentos
     print("\n📚 [1/6] Cargando documentos PDF...")
-    loader = DirectoryLoader('./data/', glob="**/*.pdf", loader_cls=PyPDFLoader, show_progress=True)
-    documents = loader.load()
+    
+    # La extracción de texto de PyPDF es CPU-bound: un proceso por núcleo
+    pdf_files = sorted(glob.glob('./data/**/*.pdf', recursive=True))
+    max_workers = max(1, (os.cpu_count() or 2) - 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pages_per_file = list(tqdm(
+            executor.map(load_pdf, pdf_files),
+            total=len(pdf_files),
+            desc="Cargando PDFs"
+        ))
+    documents = list(chain.from_iterable(pages_per_file))
     
     if not documents:
         print("❌ ERROR: No se encontraron documentos en la carpeta 'data/'")
@@ -31,11 +244,9 @@ def create_optimized_index():
     
     print(f"✅ {len(documents)} documentos cargados exitosamente")
     
-    # Mostrar qué documentos se cargaron
-    unique_sources = set()
-    for doc in documents:
-        if 'source' in doc.metadata:
-            unique_sources.add(doc.metadata['source'])
+    # Mostrar qué documentos se cargaron: las fuentes salen de la propia carga
+    # (un PDF por resultado), sin recorrer la metadata de cada página
+    unique_sources = [path for path, pages in zip(pdf_files, pages_per_file) if pages]
     
     print("\n📄 Documentos procesados:")
     for source in unique_sources:
@@ -44,7 +255,7 @@ def create_optimized_index():
     
     # Paso 2: Dividir en chunks
     print("\n✂️ [2/6] Dividiendo documentos en chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
+    text_splitter = CachedLengthTextSplitter(
         chunk_size=1000,
         chunk_overlap=100,
         separators=["\n\n", "\n", ".", " ", ""],
@@ -63,7 +274,12 @@ def create_optimized_index():
     
     # Paso 4: Generar embeddings
     print("\n🧮 [4/6] Generando embeddings vectoriales...")
-    print("   (Esto puede tomar varios minutos)")
+    print(f"   ({EMBED_CONCURRENCY} peticiones simultáneas, esto puede tomar varios minutos)")
+    
+    # Identificador de la construcción: da nombre al índice Faiss en S3 para que
+    # un index.npz nunca apunte a un índice Faiss de otra construcción
+    created_at = datetime.now(timezone.utc)
+    build_id = created_at.strftime("%Y%m%dT%H%M%SZ")
     
     index_data = {
         "chunks": [],
@@ -71,88 +287,193 @@ def create_optimized_index():
             "total_chunks": len(docs),
             "embedding_model": "amazon.titan-embed-text-v1",
             "embedding_dimension": 1536,
+            "embedding_dtype": EMBEDDING_DTYPE,
+            "normalized": True,
+            "format": "npz",
             "chunk_size": 1000,
             "chunk_overlap": 100,
-            "created_date": str(os.popen('date').read().strip())
+            "created_date": created_at.isoformat(),
+            "build_id": build_id
         }
     }
     
-    # Procesar en batches para mostrar progreso
-    batch_size = 10
-    for i in tqdm(range(0, len(docs), batch_size), desc="Procesando"):
-        batch = docs[i:i+batch_size]
+    embeddings = []
+    
+    texts = [doc.page_content for doc in docs]
+    if aioboto3 is not None:
+        results = asyncio.run(embed_texts_async(texts))
+    else:
+        results = embed_texts_threaded(embeddings_model, texts)
+    
+    for doc_index, (doc, embedding) in enumerate(zip(docs, results)):
+        if isinstance(embedding, Exception):
+            print(f"\n⚠️ Error en chunk {doc_index}: {str(embedding)}")
+            continue
         
-        for j, doc in enumerate(batch):
-            doc_index = i + j
-            
-            # Generar embedding
-            try:
-                embedding = embeddings_model.embed_query(doc.page_content)
-                
-                # Limpiar metadata para hacerla más compacta
-                clean_metadata = {
-                    "source": os.path.basename(doc.metadata.get('source', 'unknown')),
-                    "page": doc.metadata.get('page', 0)
-                }
-                
-                # Agregar al índice
-                index_data["chunks"].append({
-                    "id": doc_index,
-                    "text": doc.page_content[:1000],  # Limitar texto para reducir tamaño
-                    "embedding": embedding,
-                    "metadata": clean_metadata
-                })
-                
-            except Exception as e:
-                print(f"\n⚠️ Error en chunk {doc_index}: {str(e)}")
-                continue
+        # Limpiar metadata para hacerla más compacta
+        clean_metadata = {
+            "source": os.path.basename(doc.metadata.get('source', 'unknown')),
+            "page": doc.metadata.get('page', 0)
+        }
+        
+        # Agregar al índice (el embedding va aparte, en la matriz; la posición
+        # del chunk en la lista es su fila en la matriz)
+        index_data["chunks"].append({
+            "text": doc.page_content,
+            "metadata": clean_metadata
+        })
+        embeddings.append(embedding)
     
     successful_chunks = len(index_data["chunks"])
     print(f"\n✅ Embeddings generados: {successful_chunks}/{len(docs)} chunks")
     
-    # Paso 5: Comprimir y guardar localmente
-    print("\n💾 [5/6] Comprimiendo y guardando índice...")
+    # Paso 5: Serializar y guardar localmente
+    print("\n💾 [5/6] Serializando y guardando índice...")
     
     # Crear directorio si no existe
     os.makedirs("local_index", exist_ok=True)
     
-    # Convertir a JSON y comprimir
-    json_data = json.dumps(index_data)
-    json_size_mb = len(json_data.encode('utf-8')) / (1024 * 1024)
-    print(f"   Tamaño JSON sin comprimir: {json_size_mb:.2f} MB")
+    # Normalizar una sola vez aquí: con vectores unitarios la similitud coseno
+    # se reduce a un producto escalar y la Lambda no recalcula normas
+    embedding_matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embedding_matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embedding_matrix = embedding_matrix / norms
+    
+    # Proyección PCA opcional: menos dimensiones = menos memoria, menos bytes
+    # en S3 y un producto matriz-vector proporcionalmente más barato
+    pca_arrays = {}
+    if 0 < PCA_DIMENSION < embedding_matrix.shape[1]:
+        print(f"   Reduciendo dimensión con PCA: {embedding_matrix.shape[1]} → {PCA_DIMENSION}")
+        pca_mean = embedding_matrix.mean(axis=0)
+        centered = embedding_matrix - pca_mean
+        # Autovectores de la covarianza (D x D), más barato que la SVD de N x D
+        _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        pca_components = eigenvectors[:, ::-1][:, :PCA_DIMENSION].T  # (k, D), mayor varianza primero
+        embedding_matrix = centered @ pca_components.T
+        norms = np.linalg.norm(embedding_matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embedding_matrix /= norms
+        pca_arrays = {
+            "pca_components": pca_components.astype(np.float32),
+            "pca_mean": pca_mean.astype(np.float32)
+        }
+        index_data["metadata"]["pca_dimension"] = PCA_DIMENSION
+    
+    # Índice aproximado IVF-PQ para corpus grandes: la búsqueda solo recorre
+    # nprobe listas invertidas y cada vector ocupa M bytes (PQ{M}) en lugar de 6 KB
+    ann_index_data = None
+    ann_key = None
+    if faiss is not None and successful_chunks >= FAISS_MIN_CHUNKS:
+        vectors = np.ascontiguousarray(embedding_matrix, dtype=np.float32)  # ya normalizados: producto interno = coseno
+        nlist = max(1, min(int(4 * np.sqrt(successful_chunks)), successful_chunks // 39))
+        factory = FAISS_INDEX_FACTORY.format(nlist=nlist)
+        print(f"   Entrenando índice Faiss {factory}...")
+        ann_index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+        ann_index.train(vectors)
+        ann_index.add(vectors)
+        ann_index_data = faiss.serialize_index(ann_index).tobytes()
+        ann_key = f"index-{build_id}.faiss"
+        index_data["metadata"]["ann_index"] = ann_key
+        index_data["metadata"]["ann_factory"] = factory
+        index_data["metadata"]["ann_nprobe"] = FAISS_NPROBE
+        print(f"   Índice Faiss {factory}: {len(ann_index_data) / (1024 * 1024):.2f} MB")
     
-    compressed_data = gzip.compress(json_data.encode('utf-8'), compresslevel=9)
+    # Cuantizar la matriz: int8 con escala por vector (4x menos que float32)
+    # o float16 (2x menos)
+    if EMBEDDING_DTYPE == "int8":
+        scales = np.abs(embedding_matrix).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        embedding_arrays = {
+            "emb": np.round(embedding_matrix / scales[:, None]).astype(np.int8),
+            "emb_scale": scales.astype(np.float32)
+        }
+    else:
+        embedding_arrays = {"emb": embedding_matrix.astype(np.float16)}
+    
+    # Formato binario .npz: la matriz cuantizada se carga sin parsear texto;
+    # chunks y metadata van como JSON UTF-8 en arrays de bytes (sin pickle)
+    chunks_bytes = json.dumps(index_data["chunks"], separators=(',', ':')).encode('utf-8')
+    meta_bytes = json.dumps(index_data["metadata"]).encode('utf-8')
+    # Tamaño sin comprimir de todos los miembros del .npz (la proyección PCA
+    # incluida: k x 1536 float32)
+    arrays_size = sum(array.nbytes for array in chain(embedding_arrays.values(), pca_arrays.values()))
+    raw_size_mb = (arrays_size + len(chunks_bytes) + len(meta_bytes)) / (1024 * 1024)
+    print(f"   Tamaño sin comprimir: {raw_size_mb:.2f} MB")
+    
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        chunks=np.frombuffer(chunks_bytes, dtype=np.uint8),
+        meta=np.frombuffer(meta_bytes, dtype=np.uint8),
+        **embedding_arrays,
+        **pca_arrays
+    )
+    compressed_data = buffer.getvalue()
     compressed_size_mb = len(compressed_data) / (1024 * 1024)
     print(f"   Tamaño comprimido: {compressed_size_mb:.2f} MB")
-    print(f"   Ratio de compresión: {(1 - compressed_size_mb/json_size_mb)*100:.1f}%")
+    print(f"   Ratio de compresión: {(1 - compressed_size_mb/raw_size_mb)*100:.1f}%")
     
     # Guardar localmente
-    local_path = "local_index/index.json.gz"
+    local_path = "local_index/index.npz"
     with open(local_path, "wb") as f:
         f.write(compressed_data)
     print(f"✅ Índice guardado localmente en: {local_path}")
     
+    # Borrar índices Faiss de construcciones anteriores: local_index/ puede
+    # copiarse tal cual a la imagen de la Lambda
+    for old_path in glob.glob("local_index/index*.faiss"):
+        os.remove(old_path)
+    
+    if ann_index_data is not None:
+        with open(f"local_index/{ann_key}", "wb") as f:
+            f.write(ann_index_data)
+        print(f"✅ Índice Faiss guardado localmente en: local_index/{ann_key}")
+    
     # Paso 6: Subir a S3
     print(f"\n☁️ [6/6] Subiendo índice a S3...")
     s3_client = boto3.client('s3', region_name='eu-central-1')
     
+    # Índice Faiss al que apunta el index.npz publicado actualmente (las
+    # construcciones anteriores a los nombres versionados usaban index.faiss)
     try:
-        # Subir con metadata útil
+        previous = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key="index.npz")
+        previous_ann_key = previous.get('Metadata', {}).get('ann-index', "index.faiss")
+    except Exception:
+        previous_ann_key = None
+    
+    try:
+        # El índice Faiss se sube antes que index.npz: el .npz publicado nunca
+        # referencia un índice Faiss que aún no existe en S3
+        if ann_index_data is not None:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=ann_key,
+                Body=ann_index_data,
+                ContentType="application/octet-stream"
+            )
+            print(f"✅ Índice Faiss subido a: s3://{S3_BUCKET_NAME}/{ann_key}")
+        
+        # Subir con metadata útil (ann-index permite a la Lambda descargar el
+        # índice Faiss en paralelo sin leer antes el .npz)
+        s3_metadata = {
+            'chunks': str(successful_chunks),
+            'original-size-mb': f"{raw_size_mb:.2f}",
+            'compressed-size-mb': f"{compressed_size_mb:.2f}"
+        }
+        if ann_key:
+            s3_metadata['ann-index'] = ann_key
         s3_client.put_object(
             Bucket=S3_BUCKET_NAME,
-            Key="index.json.gz",
+            Key="index.npz",
             Body=compressed_data,
-            ContentType="application/gzip",
-            Metadata={
-                'chunks': str(successful_chunks),
-                'original-size-mb': f"{json_size_mb:.2f}",
-                'compressed-size-mb': f"{compressed_size_mb:.2f}"
-            }
+            ContentType="application/octet-stream",
+            Metadata=s3_metadata
         )
-        print(f"✅ Índice subido exitosamente a: s3://{S3_BUCKET_NAME}/index.json.gz")
+        print(f"✅ Índice subido exitosamente a: s3://{S3_BUCKET_NAME}/index.npz")
         
         # Verificar que se subió correctamente
-        response = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key="index.json.gz")
+        response = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key="index.npz")
         s3_size_mb = response['ContentLength'] / (1024 * 1024)
         print(f"✅ Verificación: Archivo en S3 tiene {s3_size_mb:.2f} MB")
         
@@ -161,6 +482,15 @@ def create_optimized_index():
         print("   Verifica que el bucket existe y tienes permisos")
         return
     
+    # El índice Faiss anterior ya no lo referencia ningún index.npz: se borra
+    # para no dejar ficheros obsoletos (y potencialmente grandes) en el bucket
+    if previous_ann_key and previous_ann_key != ann_key:
+        try:
+            s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=previous_ann_key)
+            print(f"🗑️ Índice Faiss anterior eliminado: s3://{S3_BUCKET_NAME}/{previous_ann_key}")
+        except Exception as e:
+            print(f"⚠️ No se pudo eliminar s3://{S3_BUCKET_NAME}/{previous_ann_key}: {e}")
+    
     # Resumen final
     print("\n" + "="*60)
     print("🎉 ¡ÍNDICE OPTIMIZADO CREADO CON ÉXITO!")
@@ -171,7 +501,7 @@ def create_optimized_index():
    • Total de chunks: {successful_chunks}
    • Tamaño final: {compressed_size_mb:.2f} MB (vs ~99 MB con FAISS)
    • Reducción: {(1 - compressed_size_mb/99)*100:.1f}% más pequeño
-   • Ubicación S3: s3://{S3_BUCKET_NAME}/index.json.gz
+   • Ubicación S3: s3://{S3_BUCKET_NAME}/index.npz
    
 🚀 Siguiente paso: Actualizar la función Lambda con el código optimizado
 """)
@@ -1,28 +1,157 @@
 import os
 import json
-import gzip
+import time
+import pickle
+import threading
 import boto3
-from typing import List, Dict, Any
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+import numpy as np
+from typing import List, Dict, Any, Optional
 import logging
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-# LangSmith imports
-from langsmith import Client
-from langchain.callbacks.tracers.langchain import LangChainTracer
+# Faiss es opcional: solo se usa si el índice incluye un índice aproximado IVF-PQ
+try:
+    import faiss
+except ImportError:
+    faiss = None
 
-# Configurar logging
+# orjson es opcional: (de)serializa JSON bastante más rápido que json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Configurar logging (LOG_LEVEL=DEBUG para ver eventos y preguntas completas)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO))
+
+# Clientes de AWS (inicializados fuera del handler para reutilización).
+# Keepalive TCP para que las conexiones sobrevivan entre invocaciones warm,
+# reintentos adaptativos ante throttling y pool suficiente para las
+# descargas en paralelo de S3.
+boto_config = Config(
+    tcp_keepalive=True,
+    retries={"mode": "adaptive", "max_attempts": 3},
+    max_pool_connections=50
+)
+s3_client = boto3.client("s3", region_name='eu-central-1', config=boto_config)
+bedrock_client = boto3.client(service_name='bedrock-runtime', region_name='eu-central-1', config=boto_config)
 
-# Clientes de AWS (inicializados fuera del handler para reutilización)
-s3_client = boto3.client("s3", region_name='eu-central-1')
-bedrock_client = boto3.client(service_name='bedrock-runtime', region_name='eu-central-1')
-cloudwatch = boto3.client('cloudwatch', region_name='eu-central-1')
+# Descargas de S3 en rangos de bytes paralelos para los ficheros grandes del índice
+s3_transfer_config = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True
+)
 
 # Variables de entorno
 S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME", "andres-rdn-index-storage")
-INDEX_KEY = "index.json.gz"
+INDEX_KEY = "index.npz"
+
+# Directorio con el índice incluido en la imagen de contenedor (p. ej. /opt/index).
+# Si contiene los ficheros se leen de ahí y se evita la descarga de S3.
+INDEX_LOCAL_DIR = os.environ.get("INDEX_LOCAL_DIR")
+
+# Rutas locales en /tmp (persisten mientras viva el entorno de ejecución)
+TMP_INDEX_PATH = "/tmp/index.npz"
+TMP_MATRIX_PATH = "/tmp/index_matrix.npy"
+TMP_CACHE_PATH = "/tmp/index_cache.pkl"
+
+def local_index_path(key: str):
+    """
+    Devuelve la ruta del fichero en INDEX_LOCAL_DIR si existe, o None.
+    Si index.npz está en INDEX_LOCAL_DIR, todo el índice se lee de ahí.
+    """
+    if not INDEX_LOCAL_DIR:
+        return None
+    path = os.path.join(INDEX_LOCAL_DIR, key)
+    return path if os.path.exists(path) else None
 
-# Configuración de LangSmith (opcional)
+def prefetch_index_file(key: str, path: str):
+    """
+    Descarga un fichero del índice a /tmp si no está ya disponible.
+    Si falla, load_index() repite la descarga.
+    """
+    if os.path.exists(path):
+        return
+    try:
+        logger.info(f"📥 Prefetching s3://{S3_BUCKET_NAME}/{key}")
+        s3_client.download_file(S3_BUCKET_NAME, key, path, Config=s3_transfer_config)
+    except Exception as e:
+        logger.warning(f"⚠️ Prefetch of {key} failed: {e}")
+
+def tmp_ann_path(ann_key: str) -> str:
+    """
+    Ruta en /tmp del índice Faiss (el nombre incluye el id de la construcción).
+    """
+    return os.path.join("/tmp", os.path.basename(ann_key))
+
+def published_ann_key():
+    """
+    Índice Faiss que referencia el index.npz publicado, leído de la metadata
+    del objeto en S3 (sin esperar a descargar el .npz). None si no tiene.
+    """
+    try:
+        response = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=INDEX_KEY)
+        return response.get("Metadata", {}).get("ann-index")
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read metadata of {INDEX_KEY}: {e}")
+        return None
+
+def prefetch_index():
+    """
+    Descarga en paralelo index.npz y, si faiss está instalado, el índice Faiss
+    que referencia: el tiempo de S3 del cold start pasa a ser el del fichero
+    más lento. Con el índice incluido en la imagen no se descarga nada de S3.
+    """
+    if local_index_path(INDEX_KEY):
+        return
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        if not os.path.exists(TMP_CACHE_PATH):
+            executor.submit(prefetch_index_file, INDEX_KEY, TMP_INDEX_PATH)
+        # Mientras se descarga el .npz: averiguar qué índice Faiss le corresponde
+        if faiss is not None:
+            ann_key = published_ann_key()
+            if ann_key:
+                prefetch_index_file(ann_key, tmp_ann_path(ann_key))
+
+# La descarga arranca antes de importar LangChain: la red se solapa con los
+# cientos de ms que cuesta importar los modelos pydantic
+index_prefetch = threading.Thread(target=prefetch_index, daemon=True)
+index_prefetch.start()
+
+# LangChain / Bedrock chat model
+from langchain_aws import ChatBedrock
+from langchain_core.messages import HumanMessage
+
+# Modelo de chat (construido una vez y reutilizado en invocaciones warm;
+# comparte el cliente de Bedrock y sus conexiones; los callbacks de
+# LangSmith se pasan en cada llamada)
+llm = ChatBedrock(
+    client=bedrock_client,
+    model_id="anthropic.claude-3-sonnet-20240229-v1:0",
+    model_kwargs={"temperature": 0.1, "max_tokens": 2048}
+)
+
+# Recuperación: chunks que se pegan en el prompt y similitud coseno mínima
+# (sin definir = sin umbral; los scores pueden ser negativos, sobre todo con
+# PCA). Menos chunks = menos tokens de entrada y menor latencia.
+TOP_K = int(os.environ.get("TOP_K", 4))
+MIN_SIMILARITY = float(os.environ["MIN_SIMILARITY"]) if os.environ.get("MIN_SIMILARITY") else None
+
+# Respuestas completas cacheadas por pregunta normalizada (0 = desactivada)
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", 512))
+
+# Listas IVF a recorrer por consulta (sobrescribe el valor guardado en el índice)
+FAISS_NPROBE = os.environ.get("FAISS_NPROBE")
+
+# Configuración de LangSmith (opcional). Los imports de LangSmith solo se
+# pagan en el cold start si el tracing está configurado.
 langsmith_api_key = os.environ.get('LANGSMITH_API_KEY')
 if langsmith_api_key:
     os.environ["LANGCHAIN_TRACING_V2"] = "true"
@@ -31,6 +160,7 @@ if langsmith_api_key:
     os.environ["LANGCHAIN_ENDPOINT"] = "https://eu.api.smith.langchain.com"
     langsmith_enabled = True
     try:
+        from langsmith import Client
         langsmith_client = Client()
         logger.info("✅ LangSmith configured successfully")
     except Exception as e:
@@ -40,47 +170,221 @@ else:
     langsmith_enabled = False
     logger.info("ℹ️ LangSmith not configured - functioning normally")
 
+# Callbacks de LangSmith (el tracer se crea una vez y se reutiliza en cada llamada)
+langsmith_callbacks = []
+if langsmith_enabled:
+    try:
+        from langchain_core.tracers.langchain import LangChainTracer
+        langsmith_callbacks = [LangChainTracer(
+            project_name="rag-documentation-navigator",
+            client=langsmith_client
+        )]
+    except Exception as e:
+        logger.warning(f"⚠️ Error configuring LangSmith tracer: {e}")
+
+# Plantilla del prompt EN INGLÉS (invariante entre invocaciones)
+PROMPT_TEMPLATE = """You are an expert assistant that answers questions based ONLY on the provided context.
+
+Relevant context:
+{context}
+
+User question: {question}
+
+Instructions:
+1. Answer ONLY with information from the provided context
+2. If the context doesn't contain the information, clearly state that it's not available in the documentation
+3. Be concise but complete
+4. Do not make up information
+5. Respond in English
+
+Answer:"""
+
 # Cache global para el índice (persiste entre invocaciones warm)
 INDEX_CACHE = None
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
+# Cache LRU de respuestas (persiste entre invocaciones warm)
+ANSWER_CACHE = OrderedDict()
+
+def parse_json(data):
+    """
+    Parsea JSON desde str o bytes con orjson si está disponible.
+    orjson.JSONDecodeError hereda de json.JSONDecodeError.
     """
-    Calcula la similitud coseno entre dos vectores.
-    Implementación pura en Python para evitar dependencia de NumPy.
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def to_json(data) -> str:
     """
-    dot_product = sum(a * b for a, b in zip(vec1, vec2))
-    norm1 = sum(a * a for a in vec1) ** 0.5
-    norm2 = sum(b * b for b in vec2) ** 0.5
+    Serializa a str JSON con orjson si está disponible.
+    """
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data)
+
+def prepare_index_files() -> Dict[str, Any]:
+    """
+    Descarga index.npz a /tmp (o lo lee de INDEX_LOCAL_DIR) y deja preparados los ficheros locales:
+    la matriz float32 en .npy (para mmap) y un pickle con chunks y metadata
+    ya parseados. Devuelve el índice sin la matriz.
+    """
+    # Índice incluido en la imagen o descarga desde S3 a /tmp (solo si no
+    # está ya en este entorno)
+    index_path = local_index_path(INDEX_KEY)
+    if index_path:
+        logger.info(f"📦 Using bundled index from {index_path}")
+    else:
+        index_path = TMP_INDEX_PATH
+        if not os.path.exists(index_path):
+            logger.info(f"📥 Downloading index from s3://{S3_BUCKET_NAME}/{INDEX_KEY}")
+            s3_client.download_file(S3_BUCKET_NAME, INDEX_KEY, index_path, Config=s3_transfer_config)
     
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
+    # Cargar el .npz: chunks y metadata vienen como JSON UTF-8
+    logger.info("📦 Loading index arrays...")
+    with np.load(index_path) as npz:
+        index = {
+            "chunks": parse_json(npz["chunks"].tobytes()),
+            "metadata": parse_json(npz["meta"].tobytes())
+        }
+        
+        # Proyección PCA (solo si el índice se construyó con dimensión reducida)
+        if "pca_components" in npz.files:
+            index["_pca_components"] = npz["pca_components"]
+            index["_pca_mean"] = npz["pca_mean"]
+        
+        # Los miembros de un .npz comprimido no se pueden mapear en memoria:
+        # se extrae una vez la matriz float32 (float16 o int8 en origen) a un
+        # .npy. Las filas ya vienen normalizadas desde build_index.py.
+        if not os.path.exists(TMP_MATRIX_PATH):
+            matrix = npz["emb"].astype(np.float32)
+            if "emb_scale" in npz.files:
+                # Descuantizar int8 con la escala de cada vector
+                matrix *= npz["emb_scale"][:, None]
+            
+            # Escribir a un fichero temporal y renombrar para no dejar un .npy a medias
+            partial_path = TMP_MATRIX_PATH + ".partial"
+            with open(partial_path, "wb") as f:
+                np.save(f, matrix)
+            os.replace(partial_path, TMP_MATRIX_PATH)
+            del matrix
     
-    return dot_product / (norm1 * norm2)
+    # El pickle se escribe al final: su existencia implica que el .npy está completo
+    partial_path = TMP_CACHE_PATH + ".partial"
+    with open(partial_path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial_path, TMP_CACHE_PATH)
+    
+    return index
+
+def load_ann_index(index: Dict[str, Any]):
+    """
+    Carga el índice Faiss que referencia la metadata del índice.
+    Devuelve None (búsqueda exacta) si no hay, si faiss no está instalado,
+    si el fichero no se puede descargar o abrir, o si no corresponde a
+    los mismos chunks que index.npz.
+    """
+    ann_key = index["metadata"].get("ann_index")
+    if not ann_key:
+        return None
+    if faiss is None:
+        logger.warning("⚠️ Index ships a Faiss ANN index but faiss is not installed - using exact search")
+        return None
+    
+    # Nunca se combina un index.npz de la imagen con un índice Faiss de S3:
+    # podrían venir de construcciones distintas
+    if local_index_path(INDEX_KEY):
+        faiss_path = local_index_path(ann_key)
+        if faiss_path is None:
+            logger.warning(f"⚠️ Bundled index references {ann_key} but it is not in "
+                           f"{INDEX_LOCAL_DIR} - using exact search")
+            return None
+    else:
+        faiss_path = tmp_ann_path(ann_key)
+    
+    try:
+        if not os.path.exists(faiss_path):
+            logger.info(f"📥 Downloading ANN index from s3://{S3_BUCKET_NAME}/{ann_key}")
+            s3_client.download_file(S3_BUCKET_NAME, ann_key, faiss_path, Config=s3_transfer_config)
+        # mmap de solo lectura: solo se paginan las listas que se consultan.
+        # Las tablas precalculadas de IVFPQ (métrica L2) pueden ocupar decenas
+        # de MB en RAM: no se generan al leer ni se usan al buscar.
+        read_flags = (faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                      | getattr(faiss, "IO_FLAG_SKIP_PRECOMPUTE_TABLE", 0))
+        ann_index = faiss.read_index(faiss_path, read_flags)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load Faiss ANN index {ann_key}: {e} - using exact search")
+        return None
+    
+    # Un índice Faiss de otra construcción devolvería ids de otros chunks
+    if ann_index.ntotal != len(index["chunks"]):
+        logger.warning(f"⚠️ Faiss ANN index has {ann_index.ntotal} vectors but the index has "
+                       f"{len(index['chunks'])} chunks - using exact search")
+        return None
+    
+    try:
+        ivf_index = faiss.downcast_index(faiss.extract_index_ivf(ann_index))
+    except (RuntimeError, AttributeError):
+        ivf_index = None  # sin capa IVF (p. ej. HNSW): no hay nprobe ni tablas precalculadas
+    
+    nprobe = None
+    if ivf_index is not None:
+        try:
+            ivf_index.use_precomputed_table = 0
+            ivf_index.precomputed_table.resize(0)
+        except AttributeError:
+            pass  # no es un IVFPQ: no tiene tablas precalculadas
+        
+        # ParameterSpace llega al IVF interno aunque el índice esté envuelto
+        # (p. ej. OPQ + IVF), donde asignar .nprobe no tendría efecto.
+        # Si falla, se mantiene el nprobe guardado en el índice.
+        try:
+            nprobe = int(FAISS_NPROBE or index["metadata"].get("ann_nprobe", 16))
+            faiss.ParameterSpace().set_index_parameter(ann_index, "nprobe", nprobe)
+        except Exception as e:
+            nprobe = ivf_index.nprobe
+            logger.warning(f"⚠️ Could not set Faiss nprobe: {e} - keeping nprobe={nprobe}")
+    
+    # Nivel SIMD con el que se compiló faiss (p. ej. "OPTIMIZE AVX2" o "NEON")
+    compile_options = getattr(faiss, "get_compile_options", lambda: "unknown")()
+    logger.info(f"✅ Faiss index loaded: {index['metadata'].get('ann_factory', 'IVF')} "
+                f"(nprobe={nprobe if nprobe is not None else 'n/a'}, faiss build: {compile_options})")
+    return ann_index
 
 def load_index() -> Dict[str, Any]:
     """
     Carga el índice desde S3 con sistema de cache.
     Solo descarga en cold starts, reutiliza en warm starts.
+    La matriz de embeddings se mapea en memoria desde /tmp en lugar de
+    copiarse al heap de Python.
     """
     global INDEX_CACHE
     
     if INDEX_CACHE is not None:
-        logger.info("✅ Using index from cache (warm start)")
+        logger.debug("✅ Using index from cache (warm start)")
         return INDEX_CACHE
     
+    # Esperar a las descargas lanzadas durante los imports
+    index_prefetch.join()
+    
     try:
-        logger.info(f"📥 Downloading index from s3://{S3_BUCKET_NAME}/{INDEX_KEY}")
-        
-        # Descargar desde S3
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=INDEX_KEY)
-        compressed_data = response['Body'].read()
-        
-        # Descomprimir
-        logger.info("📦 Decompressing index...")
-        json_data = gzip.decompress(compressed_data).decode('utf-8')
-        
-        # Parsear JSON
-        INDEX_CACHE = json.loads(json_data)
+        if os.path.exists(TMP_CACHE_PATH):
+            # El entorno ya procesó el índice (p. ej. el runtime se reinició tras
+            # un timeout): se evita la descarga y el parseo del JSON de chunks
+            logger.info("📦 Loading preprocessed index from /tmp")
+            with open(TMP_CACHE_PATH, "rb") as f:
+                index = pickle.load(f)
+        else:
+            index = prepare_index_files()
+        
+        # Vista mmap de solo lectura: el kernel pagina bajo demanda
+        index["_matrix"] = np.load(TMP_MATRIX_PATH, mmap_mode='r')
+        
+        # Índice aproximado IVF-PQ (solo existe para corpus grandes). Si no se
+        # puede usar, la búsqueda exacta con la matriz sigue funcionando.
+        ann_index = load_ann_index(index)
+        if ann_index is not None:
+            index["_faiss"] = ann_index
+        INDEX_CACHE = index
         
         logger.info(f"✅ Index loaded: {INDEX_CACHE['metadata']['total_chunks']} chunks")
         return INDEX_CACHE
@@ -89,46 +393,90 @@ def load_index() -> Dict[str, Any]:
         logger.error(f"❌ Error loading index: {str(e)}")
         raise
 
-def search_similar_chunks(query: str, index: Dict, top_k: int = 5) -> List[Dict]:
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Devuelve los índices de los k scores más altos, de mayor a menor.
+    argpartition selecciona en O(N) y solo se ordenan los k ganadores.
+    """
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    
+    # Particionar sobre los scores tal cual (sin la copia que crea -scores)
+    candidates = np.argpartition(scores, n - k)[n - k:] if k < n else np.arange(n)
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+@lru_cache(maxsize=512)
+def embed_query(text: str) -> np.ndarray:
+    """
+    Genera el embedding normalizado de la consulta con Titan.
+    Cacheado por texto (persiste entre invocaciones warm): las preguntas
+    repetidas se ahorran la llamada a Bedrock. Los fallos lanzan excepción
+    para que no queden en la cache.
+    Se guarda como array float32 de solo lectura (floats C contiguos, sin
+    objetos float de Python) para que la cache no pueda modificarse.
+    """
+    response = bedrock_client.invoke_model(
+        modelId="amazon.titan-embed-text-v1",
+        contentType="application/json",
+        accept="application/json",
+        body=to_json({"inputText": text})
+    )
+    
+    response_body = parse_json(response['body'].read())
+    embedding = response_body.get('embedding', [])
+    
+    if not embedding:
+        raise ValueError("Could not generate embedding for query")
+    
+    # Normalizar: con filas ya normalizadas, coseno = producto escalar
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        raise ValueError("Query embedding has zero norm")
+    vector /= norm
+    vector.flags.writeable = False
+    return vector
+
+def search_similar_chunks(query: str, index: Dict, top_k: int = TOP_K,
+                          min_similarity: Optional[float] = MIN_SIMILARITY) -> List[Dict]:
     """
     Busca los chunks más similares a la consulta usando similitud coseno.
+    Si se indica min_similarity, descarta los que no lo alcanzan, de modo que
+    las preguntas con pocos fragmentos relevantes envían menos contexto a Claude.
     """
-    logger.info(f"🔍 Searching chunks for: '{query[:50]}...'")
+    logger.debug(f"🔍 Searching chunks for: '{query[:50]}...'")
     
     try:
-        # Generar embedding de la consulta
-        response = bedrock_client.invoke_model(
-            modelId="amazon.titan-embed-text-v1",
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({"inputText": query})
-        )
-        
-        response_body = json.loads(response['body'].read())
-        query_embedding = response_body.get('embedding', [])
-        
-        if not query_embedding:
-            logger.error("Could not generate embedding for query")
-            return []
-        
-        # Calcular similitudes con todos los chunks
-        similarities = []
-        for chunk in index["chunks"]:
-            if "embedding" in chunk and chunk["embedding"]:
-                sim = cosine_similarity(query_embedding, chunk["embedding"])
-                similarities.append({
-                    "chunk": chunk,
-                    "similarity": sim
-                })
-        
-        # Ordenar por similitud y tomar los top_k
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        top_chunks = similarities[:top_k]
-        
-        logger.info(f"✅ Found {len(top_chunks)} relevant chunks")
+        # Embedding normalizado de la consulta (cacheado para preguntas repetidas)
+        query_vector = embed_query(query)
+        
+        # Llevar la consulta al mismo espacio reducido que los chunks
+        if "_pca_components" in index:
+            query_vector = index["_pca_components"] @ (query_vector - index["_pca_mean"])
+            query_norm = np.linalg.norm(query_vector)
+            if query_norm == 0:
+                logger.error("Projected query embedding has zero norm")
+                return []
+            query_vector /= query_norm
+        
+        if "_faiss" in index:
+            # Búsqueda aproximada: solo se recorren las nprobe listas más cercanas
+            scores, ids = index["_faiss"].search(query_vector.reshape(1, -1), top_k)
+            top_indices = [i for i, score in zip(ids[0], scores[0])
+                           if i >= 0 and (min_similarity is None or score >= min_similarity)]
+        else:
+            # Similitud con todos los chunks en una sola multiplicación matriz-vector
+            similarities = index["_matrix"] @ query_vector
+            top_indices = top_k_indices(similarities, top_k)
+            if min_similarity is not None:
+                top_indices = [i for i in top_indices if similarities[i] >= min_similarity]
+        
+        logger.debug(f"✅ Found {len(top_indices)} relevant chunks")
         
         # Devolver solo los chunks (sin scores)
-        return [item["chunk"] for item in top_chunks]
+        return [index["chunks"][i] for i in top_indices]
         
     except Exception as e:
         logger.error(f"Error in search: {str(e)}")
@@ -139,7 +487,6 @@ def generate_answer_with_tracking(question: str, context_chunks: List[Dict], req
     Genera una respuesta usando Claude 3 Sonnet con el contexto recuperado.
     Incluye tracking con LangSmith si está configurado.
     """
-    import time
     start_time = time.time()
     
     try:
@@ -148,62 +495,29 @@ def generate_answer_with_tracking(question: str, context_chunks: List[Dict], req
             return "No relevant information found in the documentation.", [], {}
         
         context_parts = []
-        sources = set()
+        # dict como conjunto ordenado: fuentes sin duplicados y en orden de relevancia
+        sources = {}
         
         for i, chunk in enumerate(context_chunks, 1):
             context_parts.append(f"[Fragment {i}]:\n{chunk.get('text', '')}\n")
             if 'metadata' in chunk and 'source' in chunk['metadata']:
-                sources.add(chunk['metadata']['source'])
+                sources[chunk['metadata']['source']] = None
         
         context = "\n".join(context_parts)
         
-        # Construir el prompt EN INGLÉS
-        prompt = f"""You are an expert assistant that answers questions based ONLY on the provided context.
-
-Relevant context:
-{context}
-
-User question: {question}
-
-Instructions:
-1. Answer ONLY with information from the provided context
-2. If the context doesn't contain the information, clearly state that it's not available in the documentation
-3. Be concise but complete
-4. Do not make up information
-5. Respond in English
-
-Answer:"""
-
-        # Configurar callbacks para LangSmith si está disponible
-        callbacks = []
-        if langsmith_enabled:
-            try:
-                tracer = LangChainTracer(
-                    project_name="rag-documentation-navigator",
-                    client=langsmith_client
-                )
-                callbacks = [tracer]
-                logger.info("🔍 LangSmith tracking active")
-            except Exception as e:
-                logger.warning(f"⚠️ Error configuring LangSmith tracer: {e}")
-        
-        # Usar LangChain para mejor tracking
-        from langchain_aws import ChatBedrock
-        from langchain_core.messages import HumanMessage
-        
-        llm = ChatBedrock(
-            model_id="anthropic.claude-3-sonnet-20240229-v1:0",
-            model_kwargs={"temperature": 0.1, "max_tokens": 2048},
-            callbacks=callbacks
-        )
+        prompt = PROMPT_TEMPLATE.format(context=context, question=question)
         
-        logger.info("🤖 Generating response with Claude 3 Sonnet...")
+        if langsmith_callbacks:
+            logger.debug("🔍 LangSmith tracking active")
+        
+        logger.debug("🤖 Generating response with Claude 3 Sonnet...")
         
         # Invocar con metadata para LangSmith
         message = HumanMessage(content=prompt)
         response = llm.invoke(
             [message],
             config={
+                "callbacks": langsmith_callbacks,
                 "metadata": {
                     "request_id": request_id,
                     "question_length": len(question),
@@ -216,9 +530,10 @@ Answer:"""
         
         processing_time = time.time() - start_time
         
-        # Calcular métricas de tokens
-        input_tokens = estimate_tokens(prompt)
-        output_tokens = estimate_tokens(response.content)
+        # Tokens exactos reportados por Bedrock en la respuesta de Claude
+        usage = response.usage_metadata or {}
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
         
         metrics = {
             "processing_time": processing_time,
@@ -228,119 +543,180 @@ Answer:"""
         }
         
         if langsmith_enabled:
-            logger.info(f"📊 LangSmith: {input_tokens} tokens in, {output_tokens} tokens out")
+            logger.debug(f"📊 LangSmith: {input_tokens} tokens in, {output_tokens} tokens out")
         
-        logger.info("✅ Response generated successfully")
+        logger.debug("✅ Response generated successfully")
         return response.content, list(sources), metrics
         
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}")
         return f"Error generating response: {str(e)}", [], {}
 
-def estimate_tokens(text: str) -> int:
-    """Estima tokens de forma más precisa. 1 palabra ≈ 1.3 tokens para Claude."""
-    return int(len(text.split()) * 1.3)
+def normalize_question(question: str) -> str:
+    """
+    Clave de cache: minúsculas y espacios colapsados.
+    """
+    return " ".join(question.lower().split())
+
+def get_cached_answer(key: str):
+    """
+    Devuelve la respuesta cacheada para la pregunta o None.
+    """
+    response_data = ANSWER_CACHE.get(key)
+    if response_data is not None:
+        ANSWER_CACHE.move_to_end(key)
+    return response_data
+
+def cache_answer(key: str, response_data: Dict):
+    """
+    Guarda la respuesta y descarta la menos usada si se supera ANSWER_CACHE_SIZE.
+    """
+    if ANSWER_CACHE_SIZE <= 0:
+        return
+    ANSWER_CACHE[key] = response_data
+    ANSWER_CACHE.move_to_end(key)
+    while len(ANSWER_CACHE) > ANSWER_CACHE_SIZE:
+        ANSWER_CACHE.popitem(last=False)
 
 def send_metrics_to_cloudwatch(metrics: Dict, request_id: str):
-    """Envía métricas a CloudWatch para monitoreo."""
+    """
+    Publica métricas en CloudWatch con Embedded Metric Format (EMF).
+    Se escriben como una línea JSON en stdout y CloudWatch Logs las extrae,
+    sin la llamada de red síncrona de PutMetricData.
+    """
     try:
-        cloudwatch.put_metric_data(
-            Namespace='RAGDocumentNavigator',
-            MetricData=[
-                {
-                    'MetricName': 'ResponseTime',
-                    'Value': metrics.get('processing_time', 0),
-                    'Unit': 'Seconds',
-                    'Dimensions': [{'Name': 'RequestId', 'Value': request_id}]
-                },
-                {
-                    'MetricName': 'InputTokens',
-                    'Value': metrics.get('input_tokens', 0),
-                    'Unit': 'Count'
-                },
-                {
-                    'MetricName': 'OutputTokens',
-                    'Value': metrics.get('output_tokens', 0),
-                    'Unit': 'Count'
-                }
-            ]
-        )
-        logger.info(f"📊 Metrics sent to CloudWatch")
+        print(to_json({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": "RAGDocumentNavigator",
+                    "Dimensions": [[]],
+                    "Metrics": [
+                        {"Name": "ResponseTime", "Unit": "Seconds"},
+                        {"Name": "InputTokens", "Unit": "Count"},
+                        {"Name": "OutputTokens", "Unit": "Count"}
+                    ]
+                }]
+            },
+            "ResponseTime": metrics.get('processing_time', 0),
+            "InputTokens": metrics.get('input_tokens', 0),
+            "OutputTokens": metrics.get('output_tokens', 0),
+            "RequestId": request_id
+        }))
+        logger.debug("📊 Metrics sent to CloudWatch")
     except Exception as e:
         logger.warning(f"Error sending metrics: {e}")
 
+# Cargar el índice durante la fase de init (cold start) para que la primera
+# invocación ya lo encuentre en cache. Si falla, el handler lo reintenta.
+try:
+    load_index()
+except Exception:
+    logger.warning("⚠️ Index preload failed - will retry on first request")
+
 def lambda_handler(event, context):
     """
     Handler principal de Lambda.
     Procesa las consultas y devuelve respuestas basadas en RAG.
     """
     request_id = context.aws_request_id
-    logger.info(f"📨 Event received: {json.dumps(event)[:500]}... [Request ID: {request_id}]")
+    # El evento completo puede ser grande y contiene la API key: solo en DEBUG
+    # (y sin serializarlo si DEBUG está desactivado)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📨 Event received: {to_json(event)[:500]}... [Request ID: {request_id}]")
 
     
     # Headers CORS para permitir llamadas desde el frontend
     cors_headers = {
         "Content-Type": "application/json",
         "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Content-Type",
+        "Access-Control-Allow-Headers": "Content-Type, x-api-key",
         "Access-Control-Allow-Methods": "POST, OPTIONS"
     }
 
+    # Manejar preflight CORS (el navegador no envía la API key en el preflight)
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            "statusCode": 200,
+            "headers": cors_headers,
+            "body": ""
+        }
 
     # Validar API key
-    headers = event.get('headers', {})
+    headers = event.get('headers') or {}
     provided_api_key = headers.get('x-api-key') or headers.get('X-Api-Key')
     valid_api_key = os.environ.get('VALID_API_KEY')
     
     if not provided_api_key or provided_api_key != valid_api_key:
-        logger.warning(f"Invalid API key provided: {provided_api_key}")
+        logger.warning(f"Invalid or missing API key [Request ID: {request_id}]")
         return {
             "statusCode": 401,
             "headers": cors_headers,
-            "body": json.dumps({
+            "body": to_json({
                 "error": "Unauthorized",
                 "message": "Valid API key required. Contact @andres-fmc for access."
             })
         }
-
-
-    
-    # Manejar preflight CORS
-    if event.get('httpMethod') == 'OPTIONS':
-        return {
-            "statusCode": 200,
-            "headers": cors_headers,
-            "body": ""
-        }
     
     try:
-        # 1. Extraer y validar la pregunta
-        body = json.loads(event.get("body", "{}"))
-        question = body.get("question", "").strip()
+        # 1. Extraer y validar la pregunta (antes de tocar el índice o Bedrock)
+        body = parse_json(event.get("body") or "{}")
+        if not isinstance(body, dict):
+            return {
+                "statusCode": 400,
+                "headers": cors_headers,
+                "body": to_json({
+                    "error": "Invalid JSON",
+                    "message": "The request body must be a JSON object"
+                })
+            }
+        
+        question = body.get("question")
+        question = question.strip() if isinstance(question, str) else ""
         
         if not question:
             return {
                 "statusCode": 400,
                 "headers": cors_headers,
-                "body": json.dumps({
+                "body": to_json({
                     "error": "Missing 'question' parameter",
                     "message": "Please provide a question in the request body"
                 })
             }
         
-        logger.info(f"❓ Question received: {question}")
+        logger.info(f"❓ Question received ({len(question)} chars) [Request ID: {request_id}]")
+        logger.debug(f"❓ Question: {question}")
+        
+        # Preguntas repetidas: se responde sin recuperar ni llamar a Claude
+        cache_key = normalize_question(question)
+        cached_response = get_cached_answer(cache_key)
+        if cached_response is not None:
+            logger.info(f"⚡ Answer served from cache [Request ID: {request_id}]")
+            return {
+                "statusCode": 200,
+                "headers": cors_headers,
+                "body": to_json({
+                    **cached_response,
+                    "metrics": {
+                        "response_time": 0,
+                        "tokens": {"input": 0, "output": 0},
+                        "langsmith_tracking": False
+                    },
+                    "cached": True
+                })
+            }
         
         # 2. Cargar el índice
         index = load_index()
         
         # 3. Buscar chunks similares
-        relevant_chunks = search_similar_chunks(question, index, top_k=5)
+        relevant_chunks = search_similar_chunks(question, index)
         
         if not relevant_chunks:
             return {
                 "statusCode": 200,
                 "headers": cors_headers,
-                "body": json.dumps({
+                "body": to_json({
                     "answer": "No relevant information found in the documentation for your question.",
                     "sources": [],
                     "chunks_used": 0,
@@ -370,12 +746,16 @@ def lambda_handler(event, context):
             }
         }
         
+        # Solo se cachean respuestas generadas con éxito (los errores no traen métricas)
+        if metrics:
+            cache_answer(cache_key, response_data)
+        
         logger.info(f"✅ Response prepared with {len(sources)} sources [Request ID: {request_id}]")
         
         return {
             "statusCode": 200,
             "headers": cors_headers,
-            "body": json.dumps(response_data)
+            "body": to_json(response_data)
         }
         
     except json.JSONDecodeError:
@@ -383,7 +763,7 @@ def lambda_handler(event, context):
         return {
             "statusCode": 400,
             "headers": cors_headers,
-            "body": json.dumps({
+            "body": to_json({
                 "error": "Invalid JSON",
                 "message": "The request body must be valid JSON"
             })
@@ -399,7 +779,7 @@ def lambda_handler(event, context):
         return {
             "statusCode": 500,
             "headers": cors_headers,
-            "body": json.dumps({
+            "body": to_json({
                 "error": "Internal server error",
                 "message": "An error occurred processing your request",
                 "details": str(e)